@@ -1,13 +1,16 @@
+import os
 import dash
-from dash import dcc, html, Output, Input
-import plotly.graph_objects as go
+from dash import dcc, html, Output, Input, Patch, ctx
+import plotly.io as pio
 import numpy as np
 import dash_bootstrap_components as dbc
+from flask_caching import Cache
+from galaxy_model import N_POINTS
+from kernel import build_orientations, build_ellipses
 
 # Fixed parameters
 N_galaxies = 200
 field_size = 100
-ellipticity = 0.6
 np.random.seed(42)
 
 # Galaxy positions
@@ -17,42 +20,67 @@ y = np.random.uniform(0, field_size, N_galaxies)
 # Base random orientations
 theta_random = np.random.uniform(0, np.pi, N_galaxies)
 
-# Alignment functions
-def apply_intrinsic_alignment(theta, strength=0.0, preferred_angle=0.0):
-    return (1 - strength) * theta + strength * preferred_angle
-
-def apply_lensing_shear(theta, shear_angle=0.0, shear_strength=0.0):
-    return theta + shear_strength * np.cos(theta - shear_angle)
-
-# Create ellipse traces
-def make_ellipses(x, y, theta, e=ellipticity):
-    traces = []
-    for xi, yi, t in zip(x, y, theta):
-        w = 1.0
-        h = w * e
-        # Ellipse perimeter
-        t_vals = np.linspace(0, 2*np.pi, 30)
-        ex = (w/2)*np.cos(t_vals)
-        ey = (h/2)*np.sin(t_vals)
-        # Rotate
-        ex_rot = np.cos(t)*(ex) - np.sin(t)*(ey)
-        ey_rot = np.sin(t)*(ex) + np.cos(t)*(ey)
-        # Translate
-        ex_final = ex_rot + xi
-        ey_final = ey_rot + yi
-        trace = go.Scatter(
-            x=ex_final,
-            y=ey_final,
-            mode='lines',
-            line=dict(color='blue', width=1),
-            showlegend=False
-        )
-        traces.append(trace)
-    return traces
+# Doubled-angle components of the base orientations, so the per-callback
+# sines can be expanded with the angle-subtraction identity
+COS2_TR = np.cos(2 * theta_random)
+SIN2_TR = np.sin(2 * theta_random)
+
+# Shear angles for the position-dependent patterns (independent of the sliders)
+X_CENTERED = x - 0.5
+Y_CENTERED = y - 0.5
+SHEAR_TANGENTIAL = np.arctan2(Y_CENTERED, X_CENTERED)
+SHEAR_RADIAL = SHEAR_TANGENTIAL + np.pi/2
+
+# Doubled-angle components (cos, sin) of the shear direction per pattern.
+# A uniform direction is broadcast over the galaxies without allocating.
+def uniform_shear(angle):
+    return (
+        np.broadcast_to(np.cos(2 * angle), (N_galaxies,)),
+        np.broadcast_to(np.sin(2 * angle), (N_galaxies,)),
+    )
+
+RADIAL_SHEAR = (np.cos(2 * SHEAR_RADIAL), np.sin(2 * SHEAR_RADIAL))
+TANGENTIAL_SHEAR = (np.cos(2 * SHEAR_TANGENTIAL), np.sin(2 * SHEAR_TANGENTIAL))
+NO_SHEAR = uniform_shear(0.0)
+
+SHEAR_FN = {
+    "uniform": uniform_shear,
+    "radial": lambda angle: RADIAL_SHEAR,
+    "tangential": lambda angle: TANGENTIAL_SHEAR,
+}
+
+# Orientation histogram bins over [0,180) degrees
+HIST_EDGES = np.linspace(0, 180, 31)
+HIST_CENTERS = 0.5 * (HIST_EDGES[:-1] + HIST_EDGES[1:])
+
+# Default plotly template, attached to the hand-built figure layouts
+PLOTLY_TEMPLATE = pio.templates[pio.templates.default].to_plotly_json()
+
+# Create the ellipse trace from the kernel output (plain plotly JSON)
+def make_ellipses(XY):
+    trace = {
+        "type": "scattergl",
+        "x": XY[:, :N_POINTS + 1].ravel().tolist(),
+        "y": XY[:, N_POINTS + 1:].ravel().tolist(),
+        "mode": "lines",
+        "line": {"color": "blue", "width": 1},
+        "showlegend": False,
+        "hoverinfo": "skip",
+    }
+    return [trace]
 
 # Dash app
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.MINTY],  title="Galaxy Intrinsic Alignment")
 
+# Figure cache, shared between gunicorn workers through the filesystem.
+# Keys do not include the model code, so entries from an earlier run are
+# dropped at startup.
+cache = Cache(app.server, config={
+    "CACHE_TYPE": "FileSystemCache",
+    "CACHE_DIR": os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache-dir"),
+})
+cache.clear()
+
 app.layout = html.Div([
     dbc.Row([
         dbc.Col([
@@ -171,9 +199,17 @@ app.layout = html.Div([
     ]),
 ])
 
+# Snap slider values to their steps so equal positions give equal cache keys
+def snap_inputs(ia_strength, shear_strength, preferred_angle_deg, shear_angle_deg):
+    return (
+        round(float(ia_strength), 2),
+        round(float(shear_strength), 2),
+        int(preferred_angle_deg),
+        int(shear_angle_deg),
+    )
+
 @app.callback(
     Output('galaxy-plot', 'figure'),
-    Output('histogram', 'figure'),
     [
         Input("ia-strength", "value"),
         Input("shear-strength", "value"),
@@ -191,96 +227,237 @@ def update_plot(
     shear_angle_deg,
     toggle_value,
     shear_pattern
+):
+    ia_strength, shear_strength, preferred_angle_deg, shear_angle_deg = snap_inputs(
+        ia_strength, shear_strength, preferred_angle_deg, shear_angle_deg
+    )
+
+    show_vectors = "show_vectors" in toggle_value
+    fig = build_galaxy_figure(
+        ia_strength,
+        shear_strength,
+        preferred_angle_deg,
+        shear_angle_deg,
+        show_vectors,
+        shear_pattern
+    )
+
+    # Initial render: send the complete figure
+    if ctx.triggered_id is None:
+        return fig
+
+    # Afterwards only the trace coordinates and the title change
+    ellipses, vectors = fig["data"]
+    fig_patch = Patch()
+    fig_patch["data"][0]["x"] = ellipses["x"]
+    fig_patch["data"][0]["y"] = ellipses["y"]
+    fig_patch["data"][1]["visible"] = show_vectors
+    if show_vectors:
+        fig_patch["data"][1]["x"] = vectors["x"]
+        fig_patch["data"][1]["y"] = vectors["y"]
+    fig_patch["layout"]["title"]["text"] = fig["layout"]["title"]["text"]
+
+    return fig_patch
+
+@app.callback(
+    Output('histogram', 'figure'),
+    [
+        Input("ia-strength", "value"),
+        Input("shear-strength", "value"),
+        Input("preferred-angle", "value"),
+        Input("shear-angle", "value"),
+        Input("shear-pattern", "value")
+    ],
+)
+def update_histogram(
+    ia_strength,
+    shear_strength,
+    preferred_angle_deg,
+    shear_angle_deg,
+    shear_pattern
+):
+    ia_strength, shear_strength, preferred_angle_deg, shear_angle_deg = snap_inputs(
+        ia_strength, shear_strength, preferred_angle_deg, shear_angle_deg
+    )
+
+    hist_fig = build_histogram_figure(
+        ia_strength,
+        shear_strength,
+        preferred_angle_deg,
+        shear_angle_deg,
+        shear_pattern
+    )
+
+    # Initial render: send the complete figure
+    if ctx.triggered_id is None:
+        return hist_fig
+
+    # The bin centers are fixed, only the counts change
+    hist_patch = Patch()
+    hist_patch["data"][0]["y"] = hist_fig["data"][0]["y"]
+
+    return hist_patch
+
+# Galaxy orientations for the given settings, used by both figures (not
+# cached: recomputing is cheaper than reading the result back from disk)
+def compute_orientations(
+    ia_strength,
+    shear_strength,
+    preferred_angle_deg,
+    shear_angle_deg,
+    shear_pattern
 ):
     # Convert angles to radians
     preferred_angle = np.deg2rad(preferred_angle_deg)
     shear_angle_uniform = np.deg2rad(shear_angle_deg)
 
-    # Compute shear angles depending on the pattern
-    x_centered = x - 0.5
-    y_centered = y - 0.5
-
-    if shear_pattern == "uniform":
-        shear_angles = np.full(len(x), shear_angle_uniform)
-    elif shear_pattern == "radial":
-        shear_angles = np.arctan2(y_centered, x_centered) + np.pi/2
-    elif shear_pattern == "tangential":
-        shear_angles = np.arctan2(y_centered, x_centered)
-    else:
-        shear_angles = np.zeros(len(x))
-
-    # Intrinsic alignment component
-    intrinsic_offset = ia_strength * np.sin(2 * (preferred_angle - theta_random))
-
-    # Shear component (per-galaxy)
-    shear_offset = shear_strength * np.sin(2 * (shear_angles - theta_random))
-
-    # Combine all contributions
-    theta_all = theta_random + intrinsic_offset + shear_offset
-
-    # Generate ellipses
-    ellipses = make_ellipses(x, y, theta_all)
-
-    fig = go.Figure(ellipses)
-    fig.update_layout(
-        width=550,
-        height=550,
-        xaxis=dict(range=[0, field_size], showgrid=False, zeroline=False),
-        yaxis=dict(range=[0, field_size], showgrid=False, zeroline=False),
-        title=f"IA: {ia_strength:.2f} @ {preferred_angle_deg}°, Shear: {shear_strength:.2f} @ {shear_angle_deg}°",
-        margin=dict(l=10, r=10, t=40, b=5),
+    # Shear direction depending on the pattern
+    shear_fn = SHEAR_FN.get(shear_pattern, lambda angle: NO_SHEAR)
+    cos2_shear, sin2_shear = shear_fn(shear_angle_uniform)
+
+    # Combine all contributions. Output arrays are allocated per call rather
+    # than kept at module level, since callbacks can run concurrently in a
+    # threaded server
+    theta_all = np.empty(len(x))
+    build_orientations(
+        theta_random,
+        COS2_TR,
+        SIN2_TR,
+        cos2_shear,
+        sin2_shear,
+        ia_strength,
+        shear_strength,
+        preferred_angle,
+        theta_all
     )
-    fig.update_yaxes(scaleanchor="x", scaleratio=1)
+    return theta_all
 
-    # if vectors are to be shown
-    show_vectors = "show_vectors" in toggle_value
+# Build the figures directly as plotly JSON dicts so they can be cached
+# and returned without going through the graph_objects validators
+@cache.memoize(timeout=3600)
+def build_galaxy_figure(
+    ia_strength,
+    shear_strength,
+    preferred_angle_deg,
+    shear_angle_deg,
+    show_vectors,
+    shear_pattern
+):
+    theta_all = compute_orientations(
+        ia_strength,
+        shear_strength,
+        preferred_angle_deg,
+        shear_angle_deg,
+        shear_pattern
+    )
+
+    # Generate ellipses (one row per galaxy: N_POINTS x values, a NaN
+    # separator, N_POINTS y values and another NaN separator)
+    XY = np.empty((len(x), 2*(N_POINTS + 1)))
+    build_ellipses(x, y, theta_all, XY)
+    ellipses = make_ellipses(XY)
 
+    fig = {
+        "data": ellipses,
+        "layout": {
+            "width": 550,
+            "height": 550,
+            "xaxis": {"range": [0, field_size], "showgrid": False, "zeroline": False},
+            "yaxis": {
+                "range": [0, field_size],
+                "showgrid": False,
+                "zeroline": False,
+                "scaleanchor": "x",
+                "scaleratio": 1,
+            },
+            "title": {"text": f"IA: {ia_strength:.2f} @ {preferred_angle_deg}°, Shear: {shear_strength:.2f} @ {shear_angle_deg}°"},
+            "margin": {"l": 10, "r": 10, "t": 40, "b": 5},
+            # No hover lookups, the outlines carry no tooltip content
+            "hovermode": False,
+            "template": PLOTLY_TEMPLATE,
+        },
+    }
+
+    # Vector overlay, always present so partial updates can toggle it
+    x_lines = []
+    y_lines = []
     if show_vectors:
         # Length of the axis line (adjust as needed)
         axis_length = 2.5
 
         # Compute start and end points for each line
-        x_start = x - 0.5 * axis_length * np.cos(theta_all)
-        y_start = y - 0.5 * axis_length * np.sin(theta_all)
-
-        x_end = x + 0.5 * axis_length * np.cos(theta_all)
-        y_end = y + 0.5 * axis_length * np.sin(theta_all)
-
-        # Build line segments with None separators
-        x_lines = []
-        y_lines = []
-        for xs, ys, xe, ye in zip(x_start, y_start, x_end, y_end):
-            x_lines.extend([xs, xe, None])
-            y_lines.extend([ys, ye, None])
-
-        # Add the Scatter trace
-        fig.add_trace(
-            go.Scatter(
-                x=x_lines,
-                y=y_lines,
-                mode="lines",
-                line=dict(color="red", width=1),
-                showlegend=False
-            )
-        )
-
-    # Histogram
-    angles_deg = np.degrees(theta_all) % 180  # wrap to [0,180)
-    hist_fig = go.Figure()
-    hist_fig.add_trace(go.Histogram(
-        x=angles_deg,
-        nbinsx=30,
-        marker_color='purple'
-    ))
-    hist_fig.update_layout(
-        title="Orientation Angle Histogram",
-        xaxis_title="Angle (degrees)",
-        # yaxis_title="Count",
-        bargap=0.1,
-        margin=dict(l=20, r=10, t=40, b=0),
+        dx = 0.5 * axis_length * np.cos(theta_all)
+        dy = 0.5 * axis_length * np.sin(theta_all)
+
+        x_start = x - dx
+        y_start = y - dy
+
+        x_end = x + dx
+        y_end = y + dy
+
+        # Build line segments with NaN separators
+        Xs = np.empty((len(x), 3))
+        Ys = np.empty((len(x), 3))
+        Xs[:, 0] = x_start
+        Xs[:, 1] = x_end
+        Xs[:, 2] = np.nan
+        Ys[:, 0] = y_start
+        Ys[:, 1] = y_end
+        Ys[:, 2] = np.nan
+        x_lines = Xs.ravel().tolist()
+        y_lines = Ys.ravel().tolist()
+
+    # Add the Scattergl trace
+    fig["data"].append({
+        "type": "scattergl",
+        "x": x_lines,
+        "y": y_lines,
+        "mode": "lines",
+        "line": {"color": "red", "width": 1},
+        "showlegend": False,
+        "hoverinfo": "skip",
+        "visible": show_vectors,
+    })
+
+    return fig
+
+@cache.memoize(timeout=3600)
+def build_histogram_figure(
+    ia_strength,
+    shear_strength,
+    preferred_angle_deg,
+    shear_angle_deg,
+    shear_pattern
+):
+    theta_all = compute_orientations(
+        ia_strength,
+        shear_strength,
+        preferred_angle_deg,
+        shear_angle_deg,
+        shear_pattern
     )
 
-    return fig, hist_fig
+    # Histogram, binned here so only the counts are sent to the browser
+    angles_deg = np.degrees(theta_all) % 180  # wrap to [0,180)
+    counts, _ = np.histogram(angles_deg, bins=HIST_EDGES)
+    hist_fig = {
+        "data": [{
+            "type": "bar",
+            "x": HIST_CENTERS.tolist(),
+            "y": counts.tolist(),
+            "marker": {"color": "purple"},
+        }],
+        "layout": {
+            "title": {"text": "Orientation Angle Histogram"},
+            "xaxis": {"title": {"text": "Angle (degrees)"}},
+            # "yaxis": {"title": {"text": "Count"}},
+            "bargap": 0.1,
+            "margin": {"l": 20, "r": 10, "t": 40, "b": 0},
+            "template": PLOTLY_TEMPLATE,
+        },
+    }
+
+    return hist_fig
 
 server = app.server
 
@@ -0,0 +1,47 @@
+# Galaxy model in plain NumPy (no numba needed): the ellipse template, the
+# orientation model behind the Dash app and the doubled-angle alignment
+# helpers
+import numpy as np
+
+# Galaxy axis ratio
+ellipticity = 0.6
+
+# Ellipse template (unit major axis, centred on the origin)
+N_POINTS = 30
+T_VALS = np.linspace(0, 2*np.pi, N_POINTS)
+BASE_EX = 0.5*np.cos(T_VALS)
+BASE_EY = 0.5*ellipticity*np.sin(T_VALS)
+
+def compute_theta_all(theta, ia_strength, shear_strength, preferred_angle, shear_angles):
+    """
+    Orientations after intrinsic alignment and lensing shear, as in the
+    Dash app: theta + ia*sin(2(p - theta)) + shear*sin(2(psi - theta)).
+    shear_angles may be a scalar or one angle per galaxy.
+    """
+    return (
+        theta
+        + ia_strength * np.sin(2 * (preferred_angle - theta))
+        + shear_strength * np.sin(2 * (shear_angles - theta))
+    )
+
+# Alignment functions
+# Orientations are axial (theta and theta + pi are the same galaxy), so they
+# are blended as doubled-angle unit vectors and mapped back into [0, pi]
+def mix_orientations(theta, target_angle, strength):
+    u = (1 - strength) * np.cos(2 * theta) + strength * np.cos(2 * target_angle)
+    v = (1 - strength) * np.sin(2 * theta) + strength * np.sin(2 * target_angle)
+    return 0.5 * np.arctan2(-v, -u) + 0.5 * np.pi
+
+def apply_intrinsic_alignment(theta, strength=0.0, preferred_angle=0.0):
+    """
+    Blend random orientations with alignment toward preferred_angle.
+    strength = 0: random, strength = 1: fully aligned.
+    """
+    return mix_orientations(theta, preferred_angle, strength)
+
+def apply_lensing_shear(theta, shear_angle=0.0, shear_strength=0.0):
+    """
+    Pull orientations toward the shear direction by shear_strength.
+    (For simplicity; in reality, lensing also affects ellipticity.)
+    """
+    return mix_orientations(theta, shear_angle, shear_strength)
@@ -0,0 +1,76 @@
+# Numba kernels for the Dash app
+import numpy as np
+from numba import njit, float64, void
+
+from galaxy_model import N_POINTS, BASE_EX, BASE_EY, compute_theta_all
+
+# fastmath flags used by the kernels; the no-NaN assumption is left out
+# since NaN is written as the segment separator
+FASTMATH = {"nsz", "arcp", "contract", "afn", "reassoc"}
+
+# Numba twin of galaxy_model.compute_theta_all:
+# theta + ia*sin(2(p - theta)) + shear*sin(2(psi - theta)), with both sines
+# expanded so only the precomputed doubled-angle components are needed
+@njit(fastmath=FASTMATH, cache=True)
+def build_orientations(
+    theta_random,
+    cos2_random,
+    sin2_random,
+    cos2_shear,
+    sin2_shear,
+    ia_strength,
+    shear_strength,
+    preferred_angle,
+    out_theta
+):
+    cos_pref = np.cos(2 * preferred_angle)
+    sin_pref = np.sin(2 * preferred_angle)
+    for i in range(theta_random.shape[0]):
+        # Intrinsic alignment component
+        intrinsic_offset = ia_strength * (sin_pref * cos2_random[i] - cos_pref * sin2_random[i])
+        # Shear component (per-galaxy)
+        shear_offset = shear_strength * (sin2_shear[i] * cos2_random[i] - cos2_shear[i] * sin2_random[i])
+        out_theta[i] = theta_random[i] + intrinsic_offset + shear_offset
+
+# Write the rotated, translated ellipse outlines into out_XY. The signature
+# is given explicitly so the kernel is compiled once at import for
+# contiguous float64 arrays, and the template and N_POINTS are frozen in as
+# compile-time constants so the inner loop has a fixed trip count
+@njit(
+    void(float64[::1], float64[::1], float64[::1], float64[:, ::1]),
+    fastmath=FASTMATH,
+    cache=True,
+    boundscheck=False
+)
+def build_ellipses(x, y, theta, out_XY):
+    for i in range(x.shape[0]):
+        c = np.cos(theta[i])
+        s = np.sin(theta[i])
+        for k in range(N_POINTS):
+            out_XY[i, k] = c*BASE_EX[k] - s*BASE_EY[k] + x[i]
+            out_XY[i, N_POINTS + 1 + k] = s*BASE_EX[k] + c*BASE_EY[k] + y[i]
+        out_XY[i, N_POINTS] = np.nan
+        out_XY[i, 2*N_POINTS + 1] = np.nan
+
+# Check at import that the kernel still matches the NumPy model
+def _check_build_orientations():
+    rng = np.random.default_rng(0)
+    theta = rng.uniform(0, np.pi, 16)
+    shear_angles = rng.uniform(-np.pi, np.pi, 16)
+    out_theta = np.empty(16)
+    build_orientations(
+        theta,
+        np.cos(2 * theta),
+        np.sin(2 * theta),
+        np.cos(2 * shear_angles),
+        np.sin(2 * shear_angles),
+        0.4,
+        0.7,
+        1.1,
+        out_theta
+    )
+    expected = compute_theta_all(theta, 0.4, 0.7, 1.1, shear_angles)
+    if not np.allclose(out_theta, expected):
+        raise RuntimeError("build_orientations disagrees with galaxy_model.compute_theta_all")
+
+_check_build_orientations()
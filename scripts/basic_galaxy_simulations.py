@@ -1,5 +1,13 @@
+import os
+import sys
+
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import EllipseCollection
+
+# Shared galaxy model lives in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from galaxy_model import compute_theta_all
 
 # Parameters
 N_galaxies = 200  # number of galaxies
@@ -18,30 +26,16 @@ ellipticity = np.full(N_galaxies, 0.6)
 # Random orientations (uniform between 0 and pi)
 theta_random = np.random.uniform(0, np.pi, N_galaxies)
 
-def apply_intrinsic_alignment(theta, strength=0.0, preferred_angle=0.0):
-    """
-    Blend random orientations with alignment toward preferred_angle.
-    strength = 0: random, strength = 1: fully aligned.
-    """
-    return (1 - strength) * theta + strength * preferred_angle
-
-def apply_lensing_shear(theta, shear_angle=0.0, shear_strength=0.0):
-    """
-    Approximate: shear rotates all orientations by a fixed amount.
-    (For simplicity; in reality, lensing also affects ellipticity.)
-    """
-    return theta + shear_strength * np.cos(theta - shear_angle)
-
 IA_strength = 0.6  # 0 = random, 1 = perfectly aligned
 preferred_angle = np.pi / 4  # 45 degrees
 
-theta_IA = apply_intrinsic_alignment(theta_random, IA_strength, preferred_angle)
-
 # Example: apply some lensing shear
 shear_strength = 0.3
 shear_angle = np.pi / 2  # 90 degrees
 
-theta_IA_shear = apply_lensing_shear(theta_IA, shear_angle, shear_strength)
+# Same orientation model as the Dash app
+theta_IA = compute_theta_all(theta_random, IA_strength, 0.0, preferred_angle, shear_angle)
+theta_IA_shear = compute_theta_all(theta_random, IA_strength, shear_strength, preferred_angle, shear_angle)
 
 # For visualization, plot ellipses
 def plot_galaxies(x, y, ellipticity, theta, title="Galaxy Field"):
@@ -50,19 +44,19 @@ def plot_galaxies(x, y, ellipticity, theta, title="Galaxy Field"):
     ax.set_xlim(0, field_size)
     ax.set_ylim(0, field_size)
 
-    for xi, yi, e, t in zip(x, y, ellipticity, theta):
-        width = 1.0
-        height = width * e
-        ellipse = plt.matplotlib.patches.Ellipse(
-            (xi, yi),
-            width=width,
-            height=height,
-            angle=np.degrees(t),
-            edgecolor='blue',
-            facecolor='blue',
-            alpha=0.6
-        )
-        ax.add_patch(ellipse)
+    # All galaxies as a single collection (width 1, height = axis ratio)
+    ellipses = EllipseCollection(
+        widths=np.ones(len(x)),
+        heights=ellipticity,
+        angles=np.degrees(theta),
+        units='x',
+        offsets=np.column_stack([x, y]),
+        offset_transform=ax.transData,
+        edgecolor='blue',
+        facecolor='blue',
+        alpha=0.6
+    )
+    ax.add_collection(ellipses)
 
     ax.set_title(title)
     plt.show()